@@ -0,0 +1,64 @@
+"""Compare LLM calls and wall-clock time with and without extractive pre-reduction.
+
+Groq is replaced by a fixed-latency stand-in so the numbers only reflect the
+pipeline shape. Run from the backend directory:
+
+    python -m benchmarks.bench_extractive [path/to/transcript.txt]
+
+Ranking uses TF-IDF unless EXTRACTIVE_EMBEDDINGS=1; each line reports which path ran.
+"""
+import random
+import sys
+import time
+
+from utils import extractive, url_summary
+
+SIMULATED_LLM_LATENCY = 0.8  # seconds, roughly a llama3-8b chunk summary
+
+calls = 0
+
+
+def fake_groq(text, prompt, api_key, model=None, deadline=None):
+    global calls
+    calls += 1
+    time.sleep(SIMULATED_LLM_LATENCY)
+    return text[:400]
+
+
+def synthetic_document(sentences: int = 4000) -> str:
+    random.seed(7)
+    topics = ["the election", "the central bank", "the vaccine trial", "the new stadium", "the merger"]
+    verbs = ["announced", "delayed", "questioned", "approved", "criticised"]
+    actors = ["officials", "analysts", "the committee", "local residents", "the company"]
+    return " ".join(
+        f"{random.choice(actors).capitalize()} {random.choice(verbs)} {random.choice(topics)} "
+        f"on day {i % 90} citing figure {random.randint(1, 999)}."
+        for i in range(sentences)
+    )
+
+
+def run(text: str, token_budget: int) -> tuple:
+    global calls
+    calls = 0
+    start = time.perf_counter()
+    url_summary.process_large_content(text, "youtube", "bench", token_budget=token_budget)
+    return calls, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    url_summary._groq_summary = fake_groq
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            document = f.read()
+    else:
+        document = synthetic_document()
+
+    # Load the model up front, as the server does at startup, so its load time is not measured
+    extractive.warm_embedder()
+
+    print(f"Input: {len(document)} chars")
+    for label, budget in [("baseline", 0), ("extractive", url_summary.EXTRACTIVE_TOKEN_BUDGET or 6000)]:
+        extractive.last_ranking = None
+        llm_calls, elapsed = run(document, budget)
+        ranking = f", ranked with {extractive.last_ranking}" if extractive.last_ranking else ""
+        print(f"{label:>10}: {llm_calls:4d} LLM calls, {elapsed:7.2f}s{ranking}")
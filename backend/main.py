@@ -1,14 +1,31 @@
-from fastapi import FastAPI,File,UploadFile,HTTPException
+import asyncio
+from fastapi import FastAPI,File,UploadFile,HTTPException,Request,Header
+from fastapi.responses import PlainTextResponse
 from utils.language import translate_language
 from utils.url_checker import check_url
 from utils.transcribe_audio import transcribe
 from utils.url_summary import summarize_content
-from utils.analyze_content import analyze_text
+from utils.analyze_content import analyze_text, tier_stats
+from utils.deadline import DeadlineMiddleware
+from utils.admission import AdmissionMiddleware, admission
+from utils.resilience import upstream_status
+from utils.fair_queue import ClientMiddleware, client_usage
+from utils.executor import start_pool, shutdown_pool
+from utils.extractive import warm_embedder
+from utils.model_router import model_router
+from utils.profiler import ProfilerMiddleware, Sampler, is_admin, get_trace, MAX_PROFILE_SECONDS
 from fastapi.middleware.cors import CORSMiddleware
 
 
 app = FastAPI()
 
+# Added before CORS so it still wraps the 429/503/504 responses these send.
+# Outermost first: per-client rate limits, then admission, then the deadline,
+# so rejected requests cost nothing. The profiler sits innermost, around the handler.
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(ClientMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  
@@ -18,35 +35,91 @@ app.add_middleware(
 )
     
     
+@app.on_event("startup")
+def warm_cpu_pool():
+    # Fork the workers now, while no request threads are running
+    start_pool()
+    # Ranking runs inline when the pool is unavailable, so load the model here too;
+    # loaded after forking so workers never inherit its native thread pools
+    warm_embedder()
+
+@app.on_event("shutdown")
+def stop_cpu_pool():
+    shutdown_pool()
+
+    
 @app.get("/")
 async def root():
     return {"message": "root"}
 
 
 
+@app.get("/stats")
+async def stats(x_admin_token: str = Header(None)):
+    result = {
+        "analysis_tiers": tier_stats(),
+        "admission": admission.snapshot(),
+        "upstreams": upstream_status(),
+        "models": model_router.stats()
+    }
+    # Per-client counters identify callers by IP, so only admins see them
+    if is_admin(x_admin_token):
+        result["clients"] = client_usage()
+    return result
+
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+async def profile(seconds: float = 10, x_admin_token: str = Header(None)):
+    """Sample every thread for the given number of seconds and return collapsed stacks"""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    sampler = Sampler()
+    sampler.start()
+    await asyncio.sleep(min(max(seconds, 0.1), MAX_PROFILE_SECONDS))
+    await asyncio.to_thread(sampler.stop)
+    return sampler.collapsed()
+
+
+@app.get("/admin/profile/traces/{trace_id}", response_class=PlainTextResponse)
+async def profile_trace(trace_id: str, x_admin_token: str = Header(None)):
+    """Collapsed stacks for a request sent with X-Profile-Trace (id from its X-Profile-Id header)"""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+    trace = get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Unknown profile id")
+    return trace
+
+
 @app.get("/check_url")
-async def check(url):
+def check(url):
+    # Sync handler so FastAPI runs the blocking Safe Browsing call off the event loop
     return check_url(url)
 
 @app.post("/analyze_audio")
-async def transcribe_audio(file: UploadFile = File(...)):
-    transcription = await transcribe(file)
+async def transcribe_audio(request: Request, file: UploadFile = File(...)):
+    deadline = request.state.deadline
+    transcription = await transcribe(file, deadline)
     # Now we know transcription["transcript"] is a string
-    translated_text = translate_language(transcription["transcript"])
-    result = await analyze_text(translated_text.translated)
+    translated_text = await asyncio.to_thread(translate_language, transcription["transcript"], deadline=deadline)
+    result = await analyze_text(translated_text.translated, deadline)
     
     return {**transcription, "translated": translated_text.translated, "language": translated_text.language, **result}
 
 
 @app.post("/url_summary")
-async def summarize_url(url: str):
-    summary = summarize_content(url)
-    result=await analyze_text(summary["summary"])
+async def summarize_url(request: Request, url: str):
+    deadline = request.state.deadline
+    summary = await asyncio.to_thread(summarize_content, url, deadline)
+    if "summary" not in summary:
+        # Extraction or summarization failed or ran out of time; there is nothing to analyze
+        return summary
+    result=await analyze_text(summary["summary"], deadline)
     return {**summary, **result}
 
 @app.post("/analyze_text")
-async def analyze(text: str):
-    result= await analyze_text(text)
+async def analyze(request: Request, text: str):
+    result= await analyze_text(text, request.state.deadline)
     return result
 
 
@@ -0,0 +1,125 @@
+import os
+import math
+import time
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Total concurrent requests this worker will run across all endpoints
+GLOBAL_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "48"))
+
+# Weight of the newest sample in the per-endpoint latency average
+LATENCY_ALPHA = 0.2
+
+# Per-endpoint limits. "share" is the fraction of global capacity an endpoint may
+# still be admitted into, so expensive endpoints are shed before cheap ones.
+ENDPOINT_POLICIES = {
+    "/check_url": {"max_in_flight": 32, "latency_target": 3.0, "share": 1.0},
+    "/analyze_text": {"max_in_flight": 16, "latency_target": 15.0, "share": 0.85},
+    "/analyze_audio": {"max_in_flight": 6, "latency_target": 40.0, "share": 0.6},
+    "/url_summary": {"max_in_flight": 6, "latency_target": 45.0, "share": 0.6},
+}
+
+
+class EndpointStats:
+    def __init__(self, path, max_in_flight, latency_target, share):
+        prefix = f"ADMISSION_{path.strip('/').upper()}_"
+        self.max_in_flight = int(os.getenv(prefix + "MAX_IN_FLIGHT", max_in_flight))
+        self.latency_target = float(os.getenv(prefix + "LATENCY_TARGET", latency_target))
+        self.share = share
+        self.in_flight = 0
+        self.latency = 0.0
+        self.admitted = 0
+        self.rejected = 0
+
+    def record(self, seconds):
+        self.latency = seconds if self.latency == 0.0 else (
+            LATENCY_ALPHA * seconds + (1 - LATENCY_ALPHA) * self.latency
+        )
+
+    def limit(self):
+        """Concurrency limit, shrunk in proportion to how far latency is over target"""
+        if self.latency <= self.latency_target:
+            return self.max_in_flight
+        return max(1, int(self.max_in_flight * self.latency_target / self.latency))
+
+
+class AdmissionController:
+    def __init__(self, policies=ENDPOINT_POLICIES, global_max=GLOBAL_MAX_IN_FLIGHT):
+        self.global_max = global_max
+        self.in_flight = 0
+        self.endpoints = {path: EndpointStats(path, **policy) for path, policy in policies.items()}
+
+    def try_admit(self, path):
+        """Return the endpoint stats if the request may run, None if it should be shed"""
+        stats = self.endpoints[path]
+        if stats.in_flight >= stats.limit() or self.in_flight >= self.global_max * stats.share:
+            stats.rejected += 1
+            return None
+        stats.in_flight += 1
+        stats.admitted += 1
+        self.in_flight += 1
+        return stats
+
+    def release(self, stats, seconds):
+        stats.in_flight -= 1
+        self.in_flight -= 1
+        stats.record(seconds)
+
+    def retry_after(self, path):
+        stats = self.endpoints[path]
+        return max(1, math.ceil(stats.latency or 1))
+
+    def snapshot(self):
+        return {
+            "in_flight": self.in_flight,
+            "endpoints": {
+                path: {
+                    "in_flight": stats.in_flight,
+                    "limit": stats.limit(),
+                    "latency": round(stats.latency, 3),
+                    "admitted": stats.admitted,
+                    "rejected": stats.rejected,
+                }
+                for path, stats in self.endpoints.items()
+            }
+        }
+
+
+admission = AdmissionController()
+
+
+class AdmissionMiddleware:
+    """Reject with 503 and Retry-After once an endpoint or the worker is over its limits"""
+
+    def __init__(self, app, controller=admission):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path")
+        if scope["type"] != "http" or path not in self.controller.endpoints:
+            await self.app(scope, receive, send)
+            return
+
+        stats = self.controller.try_admit(path)
+        if stats is None:
+            retry_after = self.controller.retry_after(path)
+            logger.warning(f"Shedding {path}: overloaded, retry after {retry_after}s")
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", str(retry_after).encode("latin-1")),
+                ]
+            })
+            await send({"type": "http.response.body", "body": json.dumps({"detail": "Server overloaded"}).encode()})
+            return
+
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(stats, time.monotonic() - start)
@@ -1,9 +1,16 @@
 import os
+import time
+import asyncio
 import httpx
 import json
 from typing import Dict
 import logging
 from utils.fact_checker import fact_check_text
+from utils.deadline import allows, call_timeout
+from utils.pre_classifier import classify_locally
+from utils.fair_queue import groq_dispatcher, estimate_cost
+from utils.model_router import model_router
+from utils.profiler import awaited_stage
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -13,6 +20,18 @@ logger = logging.getLogger(__name__)
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
 GROQ_MODEL = "llama-3.3-70b-versatile"  
+GROQ_SMALL_MODEL = os.getenv("GROQ_SMALL_MODEL", "llama-3.1-8b-instant")
+
+# Candidates per tier in order of preference; the router skips slow ones and hedges to the next
+ANALYSIS_MODELS = [GROQ_MODEL, os.getenv("GROQ_MODEL_FALLBACK", "llama3-70b-8192")]
+SMALL_ANALYSIS_MODELS = [GROQ_SMALL_MODEL, os.getenv("GROQ_SMALL_MODEL_FALLBACK", "llama3-8b-8192")]
+
+# Tiering: the small model's answer is kept when its self-reported confidence reaches this
+SMALL_MODEL_ENABLED = os.getenv("SMALL_MODEL_TIER", "1") == "1"
+SMALL_MODEL_CONFIDENCE_THRESHOLD = float(os.getenv("SMALL_MODEL_CONFIDENCE_THRESHOLD", "0.85"))
+
+# How many analyses each tier answered
+TIER_COUNTS = {"local": 0, "small": 0, "large": 0}
 
 # System prompt to guide Groq's LLM to structure its response
 SYSTEM_PROMPT = """
@@ -38,35 +57,75 @@ Respond in the following JSON format:
 }
 """
 
-async def analyze_text(text: str) -> Dict:
-   
-    if not GROQ_API_KEY:
-        raise RuntimeError("GROQ_API_KEY environment variable not set")
-    
+# The small model also rates its own certainty so unsure answers can be escalated
+SMALL_MODEL_PROMPT = SYSTEM_PROMPT + """
+Also include a "confidence" field: a number from 0 to 1 for how certain you are of the
+authenticity and fraud verdicts. Use a low value whenever the text is ambiguous.
+"""
+
+def fallback_analysis(reason: str) -> Dict:
+    return {
+        "authenticity": "Unknown",
+        "authenticity_reason": reason,
+        "fraudulent": False,
+        "fraud_reason": reason,
+        "ai_generated": False,
+        "ai_reason": reason,
+        "summary": reason
+    }
+
+def _confidence(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def tier_stats() -> Dict:
+    """Share of analyzed traffic answered by each tier"""
+    total = sum(TIER_COUNTS.values())
+    return {
+        tier: {"count": count, "fraction": round(count / total, 3) if total else 0.0}
+        for tier, count in TIER_COUNTS.items()
+    }
+
+async def query_groq(text: str, model: str, system_prompt: str, deadline=None, started=None) -> Dict:
+    """Ask one Groq model for a verdict in the SYSTEM_PROMPT schema; sets started once the request is sent"""
     headers = {
         "Authorization": f"Bearer {GROQ_API_KEY}",
         "Content-Type": "application/json"
     }
-    
-    
-    fact_check_result = fact_check_text(text)
-
 
     messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "system", "content": system_prompt},
         {"role": "user", "content": f"Analyze the following text:\n\n{text}"}
     ]
 
     payload = {
-        "model": GROQ_MODEL,
+        "model": model,
         "messages": messages,
         "response_format": {"type": "json_object"}  
     }
 
-    async with httpx.AsyncClient(timeout=30.0) as client:  
+    async with httpx.AsyncClient(timeout=call_timeout(deadline, 30.0)) as client:  
         try:
-            logger.info(f"Sending request to Groq API for text: '{text[:50]}...'")
-            response = await client.post(GROQ_API_URL, headers=headers, json=payload)
+            # Wait for this client's fair share of the Groq slots, but not past the deadline
+            queue_timeout = None if deadline is None else deadline.remaining()
+            # Queueing and the request itself both count as waiting on Groq in profiles
+            with awaited_stage("groq_wait", f"analyze_content.py:query_groq;{model}"):
+                async with groq_dispatcher.slot(estimate_cost(text), queue_timeout):
+                    logger.info(f"Sending request to Groq API ({model}) for text: '{text[:50]}...'")
+                    if started is not None:
+                        started.set()
+                    sent_at = time.monotonic()
+                    try:
+                        response = await client.post(GROQ_API_URL, headers=headers, json=payload)
+                    except httpx.RequestError:
+                        # Transport failures and timeouts count, so a struggling model gets routed around;
+                        # a cancelled hedge loser is not a real sample and is skipped
+                        model_router.record(model, time.monotonic() - sent_at)
+                        raise
+                    if response.status_code == 200:
+                        model_router.record(model, time.monotonic() - sent_at)
             response.raise_for_status()
             result = response.json()
             
@@ -91,15 +150,7 @@ async def analyze_text(text: str) -> Dict:
                 logger.error(f"JSON parsing error: {e}, Content: '{content}'")
                 
                 # Fallback response when JSON parsing fails
-                return {
-                    "authenticity": "Unknown",
-                    "authenticity_reason": "Failed to analyze due to technical issues",
-                    "fraudulent": False,
-                    "fraud_reason": "Failed to analyze due to technical issues",
-                    "ai_generated": False,
-                    "ai_reason": "Failed to analyze due to technical issues",
-                    "summary":"Failed to analyze due to technical issues"
-                }
+                return fallback_analysis("Failed to analyze due to technical issues")
 
             # Validate required keys
             required_keys = {
@@ -120,9 +171,17 @@ async def analyze_text(text: str) -> Dict:
                     else:
                         structured[key] = "Unknown"
                         
-            structured["Extras"] = fact_check_result
             return structured
 
+        except asyncio.TimeoutError:
+            logger.warning("Deadline reached while queued for Groq")
+            return fallback_analysis("Skipped: request deadline reached")
+        except httpx.TimeoutException as e:
+            if deadline is not None and deadline.expired():
+                logger.warning("Groq analysis cut off by request deadline")
+                return fallback_analysis("Skipped: request deadline reached")
+            logger.error(f"Timeout during analysis: {e}")
+            raise RuntimeError(f"Network error during analysis: {e}") from e
         except httpx.RequestError as e:
             logger.error(f"Network error during analysis: {e}")
             raise RuntimeError(f"Network error during analysis: {e}") from e
@@ -131,4 +190,54 @@ async def analyze_text(text: str) -> Dict:
             raise RuntimeError(f"HTTP error during analysis: {e.response.status_code}") from e
         except Exception as e:
             logger.error(f"Unexpected error during analysis: {e}")
-            raise RuntimeError(f"Unexpected error during analysis: {e}") from e
\ No newline at end of file
+            raise RuntimeError(f"Unexpected error during analysis: {e}") from e
+
+
+async def analyze_text(text: str, deadline=None) -> Dict:
+   
+    if not GROQ_API_KEY:
+        raise RuntimeError("GROQ_API_KEY environment variable not set")
+
+    # Tier 1: obvious cases are answered locally without fact checking or an LLM call
+    local = classify_locally(text)
+    if local is not None:
+        TIER_COUNTS["local"] += 1
+        local["analysis_tier"] = "local"
+        local["Extras"] = {"alert": "No Data", "confidence": 0, "source": None, "claims": [], "unchecked": 0}
+        return local
+    
+    # Fact checking blocks on upstream calls, so keep it off the event loop
+    fact_check_result = await asyncio.to_thread(fact_check_text, text, deadline)
+
+    if not allows(deadline, "analysis"):
+        logger.warning("Skipping Groq analysis: request deadline reached")
+        structured = fallback_analysis("Skipped: request deadline reached")
+        structured["Extras"] = fact_check_result
+        return structured
+
+    structured, tier = None, "large"
+    # Tier 2: the small model answers when it reports enough confidence
+    if SMALL_MODEL_ENABLED:
+        try:
+            candidate = await model_router.hedged(
+                lambda model, started: query_groq(text, model, SMALL_MODEL_PROMPT, deadline, started),
+                len(text), SMALL_ANALYSIS_MODELS, deadline, busy=groq_dispatcher.saturated
+            )
+            confident = _confidence(candidate.pop("confidence", 0)) >= SMALL_MODEL_CONFIDENCE_THRESHOLD
+            # Without budget for the large model, the small model's answer is the best we have
+            if confident or not allows(deadline, "analysis"):
+                structured, tier = candidate, "small"
+        except RuntimeError as e:
+            logger.warning(f"Small model tier failed, escalating: {e}")
+
+    # Tier 3: the large model
+    if structured is None:
+        structured = await model_router.hedged(
+            lambda model, started: query_groq(text, model, SYSTEM_PROMPT, deadline, started),
+            len(text), ANALYSIS_MODELS, deadline, busy=groq_dispatcher.saturated
+        )
+
+    TIER_COUNTS[tier] += 1
+    structured["analysis_tier"] = tier
+    structured["Extras"] = fact_check_result
+    return structured
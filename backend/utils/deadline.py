@@ -0,0 +1,148 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_HEADER = b"x-request-timeout"
+MAX_REQUEST_TIMEOUT = float(os.getenv("MAX_REQUEST_TIMEOUT", "120"))
+
+# Default end-to-end budget per endpoint, in seconds
+ENDPOINT_TIMEOUTS = {
+    "/analyze_text": float(os.getenv("ANALYZE_TEXT_TIMEOUT", "30")),
+    "/url_summary": float(os.getenv("URL_SUMMARY_TIMEOUT", "90")),
+    "/analyze_audio": float(os.getenv("ANALYZE_AUDIO_TIMEOUT", "60")),
+    "/check_url": float(os.getenv("CHECK_URL_TIMEOUT", "10")),
+    "/admin/profile": 70.0,
+}
+DEFAULT_TIMEOUT = 30.0
+
+# Extra time the handler gets past its deadline to return a degraded result before it is cancelled
+CANCEL_GRACE = 2.0
+
+# Minimum remaining budget each stage needs to be worth starting
+STAGE_BUDGETS = {
+    "extraction": 3.0,
+    "summarization": 4.0,
+    "fact_check": 6.0,  # includes room for the analysis stage that follows
+    "translation": 2.0,
+    "analysis": 3.0,
+}
+
+
+class Deadline:
+    """End-to-end budget for one request, shared by every stage it passes through"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        # Set when the client disconnects so worker threads stop starting new upstream calls
+        self.cancelled = threading.Event()
+
+    def remaining(self):
+        if self.cancelled.is_set():
+            return 0.0
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def allows(self, stage):
+        """True if enough budget is left to start the given stage"""
+        return self.remaining() >= STAGE_BUDGETS.get(stage, 0.0)
+
+    def timeout(self, cap=None):
+        """Timeout for a single upstream call: the remaining budget, optionally capped"""
+        remaining = self.remaining()
+        return remaining if cap is None else min(cap, remaining)
+
+
+def allows(deadline, stage):
+    """Stage check that treats a missing deadline as unlimited"""
+    return deadline is None or deadline.allows(stage)
+
+
+def call_timeout(deadline, cap):
+    return cap if deadline is None else max(0.1, deadline.timeout(cap))
+
+
+def deadline_for(path, headers):
+    seconds = ENDPOINT_TIMEOUTS.get(path, DEFAULT_TIMEOUT)
+    for name, value in headers:
+        if name.lower() == DEADLINE_HEADER:
+            try:
+                seconds = float(value.decode("latin-1"))
+            except ValueError:
+                pass
+            break
+    return Deadline(min(max(seconds, 0.0), MAX_REQUEST_TIMEOUT))
+
+
+class DeadlineMiddleware:
+    """Attach a Deadline to each request and cancel the handler on client disconnect or overrun"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        deadline = deadline_for(scope["path"], scope.get("headers", []))
+        scope.setdefault("state", {})["deadline"] = deadline
+
+        # Relay incoming messages through a queue so we keep listening for
+        # http.disconnect after the handler has finished reading the body
+        messages = asyncio.Queue()
+        response_started = False
+
+        async def relay():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    return
+
+        async def send_wrapper(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        handler = asyncio.ensure_future(self.app(scope, messages.get, send_wrapper))
+        listener = asyncio.ensure_future(relay())
+        try:
+            done, _ = await asyncio.wait(
+                {handler, listener},
+                timeout=deadline.seconds + CANCEL_GRACE,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if handler in done:
+                handler.result()
+                return
+
+            deadline.cancelled.set()
+            handler.cancel()
+            # Let the handler's cleanup (slot releases, finally blocks) run before we respond;
+            # asyncio.wait never raises, so our own cancellation still propagates
+            await asyncio.wait({handler})
+            if not handler.cancelled() and handler.exception() is not None:
+                logger.warning(f"Handler for {scope['path']} failed while cancelling: {handler.exception()}")
+            if listener in done:
+                logger.info(f"Client disconnected, cancelled {scope['path']}")
+                return
+            logger.warning(f"Request to {scope['path']} exceeded its {deadline.seconds}s deadline")
+            if not response_started:
+                await send({
+                    "type": "http.response.start",
+                    "status": 504,
+                    "headers": [(b"content-type", b"application/json")]
+                })
+                await send({"type": "http.response.body", "body": b'{"detail":"Request deadline exceeded"}'})
+        finally:
+            listener.cancel()
+            # Background worker threads check this and stop issuing upstream calls
+            deadline.cancelled.set()
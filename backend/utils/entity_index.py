@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import math
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+ENTITY_INDEX_PATH = os.getenv("ENTITY_INDEX_PATH", os.path.join(os.path.dirname(__file__), "..", "data", "entity_index.json"))
+ENTITY_DUMP_PATH = os.getenv("ENTITY_DUMP_PATH")
+
+# Persist after this many new entities instead of on every insert
+SAVE_EVERY = 25
+
+# BM25 parameters and the minimum share of query terms a local hit must cover
+BM25_K1 = 1.5
+BM25_B = 0.75
+TITLE_WEIGHT = 3
+MIN_QUERY_COVERAGE = 0.8
+
+# A local hit needs every title term in the query, so candidates are found through title
+# terms; terms in more titles than this ("the", "of") are skipped when collecting them
+MAX_TITLE_DF = 1000
+
+
+def tokenize(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def normalize_query(query):
+    return ' '.join(tokenize(query))
+
+
+class EntityIndex:
+    """BM25 inverted index over Wikipedia titles and summaries, persisted as JSON"""
+
+    def __init__(self, path=ENTITY_INDEX_PATH):
+        self.path = path
+        self.docs = []          # [{"title", "text", "source"}]
+        self.titles = {}        # normalized title -> doc id
+        self.aliases = {}       # normalized query -> doc id
+        self.postings = defaultdict(dict)  # term -> {doc id: weighted tf}
+        self.title_postings = defaultdict(set)  # title term -> doc ids
+        self.title_terms = []   # doc id -> frozenset of title terms
+        self.doc_lengths = []
+        self.total_length = 0
+        self.unsaved = 0
+        self.lock = threading.RLock()
+        # Serializes writers; held while writing to disk, never together with self.lock
+        self.save_lock = threading.Lock()
+        self.saving = False
+
+    def _index_doc(self, doc_id, doc):
+        counts = defaultdict(int)
+        title_terms = frozenset(tokenize(doc["title"]))
+        self.title_terms.append(title_terms)
+        for term in title_terms:
+            self.title_postings[term].add(doc_id)
+        for term in tokenize(doc["title"]):
+            counts[term] += TITLE_WEIGHT
+        for term in tokenize(doc["text"]):
+            counts[term] += 1
+        for term, tf in counts.items():
+            self.postings[term][doc_id] = tf
+        length = sum(counts.values())
+        self.doc_lengths.append(length)
+        self.total_length += length
+
+    def _add(self, title, text, source, query=None):
+        key = normalize_query(title)
+        doc_id = self.titles.get(key)
+        if doc_id is None:
+            doc_id = len(self.docs)
+            doc = {"title": title, "text": text, "source": source}
+            self.docs.append(doc)
+            self.titles[key] = doc_id
+            self._index_doc(doc_id, doc)
+            self.unsaved += 1
+        if query:
+            alias = normalize_query(query)
+            if alias and self.aliases.get(alias) != doc_id:
+                self.aliases[alias] = doc_id
+                self.unsaved += 1
+        return doc_id
+
+    def add(self, title, text, source, query=None):
+        """Add an entity (or reuse the existing one) and remember the query that found it"""
+        with self.lock:
+            doc_id = self._add(title, text, source, query)
+            save_now = self.unsaved >= SAVE_EVERY and not self.saving
+            if save_now:
+                self.saving = True
+        if save_now:
+            # Writing a large index takes seconds, so keep it off the request thread
+            threading.Thread(target=self._background_save, name="entity-index-save", daemon=True).start()
+        return doc_id
+
+    def _background_save(self):
+        try:
+            self.save()
+        finally:
+            self.saving = False
+
+    def _candidates(self, terms):
+        """Docs whose title terms all appear in the query, the only ones a lookup may accept"""
+        query_terms = set(terms)
+        candidates = set()
+        for term in query_terms:
+            docs = self.title_postings.get(term)
+            if docs and len(docs) <= MAX_TITLE_DF:
+                candidates.update(docs)
+        return [doc_id for doc_id in candidates if self.title_terms[doc_id] <= query_terms]
+
+    def _bm25(self, terms, candidates):
+        """BM25 scores for the candidate docs only, so cost does not grow with the index"""
+        n = len(self.docs)
+        avg_length = self.total_length / n
+        scores = defaultdict(float)
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id in candidates:
+                tf = postings.get(doc_id)
+                if tf is None:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def lookup(self, query):
+        """Resolve a keyword query locally, returning {"text", "source"} or None on a miss"""
+        key = normalize_query(query)
+        if not key:
+            return None
+        with self.lock:
+            doc_id = self.aliases.get(key, self.titles.get(key))
+            if doc_id is None and self.docs:
+                terms = key.split()
+                scores = self._bm25(terms, self._candidates(terms))
+                if scores:
+                    best = max(scores, key=scores.get)
+                    doc_terms = self.title_terms[best] | set(tokenize(self.docs[best]["text"]))
+                    coverage = sum(1 for t in terms if t in doc_terms) / len(terms)
+                    if coverage >= MIN_QUERY_COVERAGE:
+                        doc_id = best
+            if doc_id is None:
+                return None
+            doc = self.docs[doc_id]
+            return {"text": doc["text"], "source": doc["source"]}
+
+    def load(self, path=None):
+        path = path or self.path
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load entity index from {path}: {e}")
+            return
+        with self.lock:
+            for doc in data.get("docs", []):
+                self._add(doc["title"], doc["text"], doc["source"])
+            for alias, title in data.get("aliases", {}).items():
+                doc_id = self.titles.get(normalize_query(title))
+                if doc_id is not None:
+                    self.aliases[alias] = doc_id
+            self.unsaved = 0
+        logger.info(f"Loaded {len(self.docs)} entities from {path}")
+
+    def preload_dump(self, path):
+        """Bulk-load a JSON Lines dump with title, text (or summary) and url (or source) per line"""
+        count = 0
+        with self.lock, open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    self._add(
+                        record["title"],
+                        record.get("text") or record.get("summary", ""),
+                        record.get("source") or record.get("url")
+                    )
+                    count += 1
+                except (ValueError, KeyError) as e:
+                    logger.warning(f"Skipping malformed entity dump line: {e}")
+        if self.unsaved:
+            self.save()
+        logger.info(f"Preloaded {count} entities from {path}")
+        return count
+
+    def _snapshot(self):
+        """Copy what save() writes; docs are never mutated once added, so a shallow copy is enough"""
+        with self.lock:
+            pending, self.unsaved = self.unsaved, 0
+            return pending, {
+                "docs": list(self.docs),
+                "aliases": {alias: self.docs[doc_id]["title"] for alias, doc_id in self.aliases.items()}
+            }
+
+    def save(self, path=None):
+        """Write the index atomically; lookups only wait for the snapshot, not the write"""
+        path = path or self.path
+        with self.save_lock:
+            pending, data = self._snapshot()
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Could not save entity index to {path}: {e}")
+                with self.lock:
+                    self.unsaved += pending
+
+
+entity_index = EntityIndex()
+entity_index.load()
+if ENTITY_DUMP_PATH and os.path.exists(ENTITY_DUMP_PATH):
+    entity_index.preload_dump(ENTITY_DUMP_PATH)
+atexit.register(lambda: entity_index.unsaved and entity_index.save())
@@ -0,0 +1,115 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus():
+    """CPUs this process may actually use: its affinity mask, capped by a cgroup v2 CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", available_cpus()))
+
+# Inputs shorter than this run inline; pickling them to a worker costs more than the work
+SMALL_INPUT_CHARS = int(os.getenv("CPU_OFFLOAD_MIN_CHARS", "20000"))
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _warm_worker():
+    """Load parsers and language models once per worker process"""
+    import langid
+    from langdetect import detect
+    from bs4 import BeautifulSoup
+    from nltk.tokenize import sent_tokenize
+    from utils.extractive import warm_embedder
+    langid.classify("warm up the language model")
+    # langdetect loads its language profiles on first use
+    detect("warm up the language profiles")
+    try:
+        sent_tokenize("Warm up the tokenizer. It loads punkt once.")
+    except LookupError:
+        # Missing tokenizer data; callers fall back to a regex split
+        pass
+    BeautifulSoup("<p>warm up</p>", "html.parser")
+    warm_embedder()
+
+
+def _noop():
+    return os.getpid()
+
+
+def _create_pool(workers, start_method):
+    """Start and pre-warm a pool, or return None if its workers fail to come up"""
+    context = multiprocessing.get_context(start_method) if start_method in multiprocessing.get_all_start_methods() else None
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_warm_worker)
+    try:
+        pids = {future.result() for future in [pool.submit(_noop) for _ in range(workers)]}
+    except Exception as e:
+        # A failing initializer breaks the whole pool; serve CPU work inline rather than fail
+        logger.error(f"CPU pool failed to start, running CPU work inline: {e}")
+        pool.shutdown(wait=False, cancel_futures=True)
+        return None
+    logger.info(f"CPU pool ready with {len(pids)} warm workers")
+    return pool
+
+
+def start_pool(workers=CPU_WORKERS):
+    """Create and pre-warm the process pool; call at startup, before request threads exist"""
+    global _pool, _pool_workers
+    if _pool is not None or workers < 1:
+        return
+    # Forking shares already-imported modules copy-on-write; fall back where fork is unavailable
+    _pool_workers = workers
+    _pool = _create_pool(workers, "fork")
+
+
+def _replace_broken_pool(broken):
+    """Swap a broken pool for a new one, once, however many callers saw it break"""
+    global _pool
+    with _pool_lock:
+        if _pool is not broken:
+            return
+        logger.error("CPU pool broken, restarting it")
+        broken.shutdown(wait=False, cancel_futures=True)
+        # Request threads exist by now, so start workers from a clean forkserver instead of forking
+        _pool = _create_pool(_pool_workers, "forkserver")
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def run_cpu(fn, *args, size=0, min_size=SMALL_INPUT_CHARS):
+    """Run a CPU-bound, picklable function in the pool, or inline for small inputs"""
+    pool = _pool
+    if pool is None or size < min_size:
+        return fn(*args)
+    try:
+        return pool.submit(fn, *args).result()
+    except BrokenProcessPool:
+        _replace_broken_pool(pool)
+        return fn(*args)
@@ -0,0 +1,177 @@
+import os
+import re
+import time
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rough characters-per-token ratio used to turn a token budget into a length budget
+CHARS_PER_TOKEN = 4
+
+# Transcripts often have no punctuation, so fall back to fixed word windows
+WORDS_PER_PSEUDO_SENTENCE = 30
+
+# The similarity graph is n x n, so very long inputs are ranked in merged groups
+MAX_RANKED_UNITS = 3000
+
+# Vocabulary is hashed into a fixed width to keep the TF-IDF matrix bounded
+HASH_FEATURES = 4096
+
+# Embedding-based ranking is opt-in: CPU encoding of a long transcript can cost more
+# than the LLM calls it saves, so hashed TF-IDF is the default
+USE_EMBEDDINGS = os.getenv("EXTRACTIVE_EMBEDDINGS", "0") == "1"
+EMBEDDING_MODEL = os.getenv("EXTRACTIVE_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BATCH_SIZE = 256
+
+# Seconds embedding may take before ranking falls back to TF-IDF
+RANKING_TIME_BUDGET = float(os.getenv("EXTRACTIVE_RANKING_TIME_BUDGET", "3"))
+
+_embedder = None
+_embedder_loaded = False
+
+# Which path ranked the most recent input in this process ("embeddings" or "tfidf")
+last_ranking = None
+
+
+def _get_embedder():
+    """Load the sentence_transformers model once, if enabled and the package is available"""
+    global _embedder, _embedder_loaded
+    if not _embedder_loaded:
+        _embedder_loaded = True
+        if not USE_EMBEDDINGS:
+            return None
+        try:
+            from sentence_transformers import SentenceTransformer
+            _embedder = SentenceTransformer(EMBEDDING_MODEL)
+        except Exception as e:
+            logger.info(f"sentence_transformers unavailable, using TF-IDF centrality: {e}")
+            _embedder = None
+    return _embedder
+
+
+def warm_embedder():
+    """Load the embedding model ahead of the first request; a no-op unless embeddings are enabled"""
+    embedder = _get_embedder()
+    if embedder is not None:
+        embedder.encode(["Warm up the embedding model."])
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_sentences(text: str) -> list:
+    """Split text into sentences, or word windows when punctuation is missing."""
+    sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', text) if s.strip()]
+    if len(sentences) <= 1:
+        words = text.split()
+        sentences = [
+            ' '.join(words[i:i + WORDS_PER_PSEUDO_SENTENCE])
+            for i in range(0, len(words), WORDS_PER_PSEUDO_SENTENCE)
+        ]
+
+    if len(sentences) > MAX_RANKED_UNITS:
+        group = -(-len(sentences) // MAX_RANKED_UNITS)
+        sentences = [' '.join(sentences[i:i + group]) for i in range(0, len(sentences), group)]
+    return sentences
+
+
+def _tfidf_matrix(sentences: list) -> np.ndarray:
+    """Build an L2-normalised hashed TF-IDF matrix (sentences x HASH_FEATURES)."""
+    rows, cols = [], []
+    for row, sentence in enumerate(sentences):
+        for token in re.findall(r'\w+', sentence.lower()):
+            rows.append(row)
+            cols.append(hash(token) % HASH_FEATURES)
+
+    tf = np.zeros((len(sentences), HASH_FEATURES), dtype=np.float32)
+    np.add.at(tf, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)), 1.0)
+
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log((1 + len(sentences)) / (1 + df)) + 1.0
+    matrix = tf * idf.astype(np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-9)
+
+
+def _encode_within_budget(embedder, sentences: list):
+    """Encode in batches, giving up (None) once RANKING_TIME_BUDGET is spent"""
+    started = time.monotonic()
+    batches = []
+    for i in range(0, len(sentences), EMBEDDING_BATCH_SIZE):
+        if time.monotonic() - started > RANKING_TIME_BUDGET:
+            logger.warning(f"Embedding exceeded {RANKING_TIME_BUDGET}s after {i}/{len(sentences)} sentences, using TF-IDF centrality")
+            return None
+        batch = sentences[i:i + EMBEDDING_BATCH_SIZE]
+        batches.append(np.asarray(embedder.encode(batch, normalize_embeddings=True), dtype=np.float32))
+    return np.vstack(batches)
+
+
+def _embed(sentences: list) -> np.ndarray:
+    global last_ranking
+    embedder = _get_embedder()
+    if embedder is not None:
+        try:
+            vectors = _encode_within_budget(embedder, sentences)
+            if vectors is not None:
+                last_ranking = "embeddings"
+                return vectors
+        except Exception as e:
+            logger.warning(f"Embedding failed, using TF-IDF centrality: {e}")
+    last_ranking = "tfidf"
+    return _tfidf_matrix(sentences)
+
+
+def score_sentences(sentences: list, damping: float = 0.85, iterations: int = 50) -> np.ndarray:
+    """Score sentences with TextRank over the cosine-similarity graph."""
+    n = len(sentences)
+    if n == 0:
+        return np.zeros(0, dtype=np.float32)
+    if n == 1:
+        return np.ones(1, dtype=np.float32)
+
+    vectors = _embed(sentences)
+    similarity = np.clip(vectors @ vectors.T, 0.0, None)
+    np.fill_diagonal(similarity, 0.0)
+
+    # Row-normalise into a transition matrix; isolated sentences jump uniformly
+    row_sums = similarity.sum(axis=1, keepdims=True)
+    transition = np.where(row_sums > 0, similarity / np.maximum(row_sums, 1e-9), 1.0 / n)
+
+    scores = np.full(n, 1.0 / n, dtype=np.float32)
+    for _ in range(iterations):
+        updated = (1 - damping) / n + damping * (transition.T @ scores)
+        if np.abs(updated - scores).sum() < 1e-6:
+            scores = updated
+            break
+        scores = updated
+    return scores
+
+
+def reduce_text(text: str, token_budget: int) -> str:
+    """Keep the highest-ranked sentences within token_budget, in original order."""
+    if not text or estimate_tokens(text) <= token_budget:
+        return text
+
+    sentences = split_sentences(text)
+    if len(sentences) <= 1:
+        return text
+
+    scores = score_sentences(sentences)
+    budget = token_budget * CHARS_PER_TOKEN
+
+    selected, used = [], 0
+    for index in np.argsort(-scores, kind="stable"):
+        length = len(sentences[index]) + 1
+        if used + length > budget:
+            continue
+        selected.append(index)
+        used += length
+
+    if not selected:
+        return text[:budget]
+
+    reduced = ' '.join(sentences[i] for i in sorted(selected))
+    logger.info(f"Extractive reduction: {len(text)} -> {len(reduced)} chars ({len(selected)}/{len(sentences)} sentences)")
+    return reduced
@@ -4,25 +4,63 @@ from nltk.tokenize import sent_tokenize
 import wikipedia
 import re
 import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv
+from utils.entity_index import entity_index
+from utils.resilience import fact_check_api, wikipedia_api, UpstreamUnavailable
+from utils.deadline import allows, STAGE_BUDGETS
+from utils.executor import run_cpu
+from utils.profiler import pipeline_stage, in_current_context
 
 # Load environment variables
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-# Download NLTK tokenizer data if not present
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+# Claim-level checking limits
+MAX_CLAIMS = int(os.getenv("FACT_CHECK_MAX_CLAIMS", "12"))
+MAX_PARALLEL_CHECKS = int(os.getenv("FACT_CHECK_PARALLELISM", "4"))
+CLAIM_CACHE_SIZE = int(os.getenv("FACT_CHECK_CACHE_SIZE", "2048"))
+# "No Data" verdicts are re-checked after this many seconds, in case sources appear later
+NEGATIVE_CACHE_TTL = float(os.getenv("FACT_CHECK_NEGATIVE_TTL", "600"))
+MIN_CLAIM_WORDS = 5
+MAX_CLAIM_CHARS = 400
+
+_executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_CHECKS, thread_name_prefix="fact-check")
+_claim_cache = OrderedDict()
+_claim_cache_lock = threading.Lock()
+
+# Download NLTK tokenizer data if not present (newer nltk releases need punkt_tab)
+for resource in ('punkt', 'punkt_tab'):
+    try:
+        nltk.data.find(f'tokenizers/{resource}')
+    except LookupError:
+        nltk.download(resource, quiet=True)
+
+def split_sentences(text):
+    """Sentence-split with nltk, or a punctuation regex when its data is missing"""
+    try:
+        return sent_tokenize(text)
+    except LookupError:
+        return [s for s in re.split(r'(?<=[.!?])\s+', text) if s.strip()]
 
 def clean_text(text):
     text = re.sub(r'\[\d+\]|\[citation needed\]', '', text)
     text = re.sub(r'\s+', ' ', text)
     return text.strip()
 
-def fetch_fact_check(query):
-    """Fetch fact-check data from Google's Fact Check API"""
+def _get_fact_check(url, params):
+    response = requests.get(url, params=params, timeout=fact_check_api.timeout)
+    # Only server-side errors count against the circuit breaker
+    if response.status_code >= 500:
+        response.raise_for_status()
+    return response
+
+def fetch_fact_check(query, deadline=None):
+    """Fetch fact-check data from Google's Fact Check API; None means the lookup failed"""
     url = "https://factchecktools.googleapis.com/v1alpha1/claims:search"
     params = {
         "query": query[:200],
@@ -30,54 +68,189 @@ def fetch_fact_check(query):
         "languageCode": "en"
     }
     try:
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            if "claims" in data:
-                return [
-                    {
-                        "text": claim["text"],
-                        "verdict": claim["claimReview"][0]["textualRating"],
-                        "source": claim["claimReview"][0]["url"]
-                    }
-                    for claim in data["claims"]
-                ]
+        response = fact_check_api.call_within(deadline, _get_fact_check, url, params)
+        if response.status_code != 200:
+            print(f"Fact Check API Error: HTTP {response.status_code}")
+            return None
+        data = response.json()
+        if "claims" in data:
+            return [
+                {
+                    "text": claim["text"],
+                    "verdict": claim["claimReview"][0]["textualRating"],
+                    "source": claim["claimReview"][0]["url"]
+                }
+                for claim in data["claims"]
+            ]
+        return []
     except Exception as e:
         print(f"Fact Check API Error: {e}")
-    return []
+        return None
 
-def search_wikipedia(text):
-    """Try to find a Wikipedia summary of the topic"""
+def _fetch_wikipedia_page(keywords):
+    """Return the best matching page as a dict, or None when Wikipedia has no usable answer"""
     try:
-        first_sentence = sent_tokenize(text)[0]
-        keywords = ' '.join(re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b', first_sentence))
-        if not keywords:
-            keywords = ' '.join(first_sentence.split()[:5])
         results = wikipedia.search(keywords, results=1)
         if results:
             page = wikipedia.page(results[0], auto_suggest=False)
-            return {
-                "text": page.summary,
-                "source": page.url
-            }
+            # page.summary is fetched lazily, so read it here, inside the bulkhead and timeout
+            return {"title": page.title, "summary": page.summary, "url": page.url}
+    except (wikipedia.exceptions.DisambiguationError, wikipedia.exceptions.PageError):
+        pass
+    return None
+
+def _search_wikipedia(text, deadline=None):
+    """Find a Wikipedia summary of the topic, raising if Wikipedia could not be asked"""
+    first_sentence = split_sentences(text)[0]
+    keywords = ' '.join(re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b', first_sentence))
+    if not keywords:
+        keywords = ' '.join(first_sentence.split()[:5])
+    # Resolve locally first and only hit Wikipedia on a miss
+    local = entity_index.lookup(keywords)
+    if local:
+        return local
+    page = wikipedia_api.call_within(deadline, _fetch_wikipedia_page, keywords)
+    if page:
+        entity_index.add(page["title"], page["summary"], page["url"], query=keywords)
+        return {
+            "text": page["summary"],
+            "source": page["url"]
+        }
+    return None
+
+def search_wikipedia(text, deadline=None):
+    """Try to find a Wikipedia summary of the topic"""
+    try:
+        return _search_wikipedia(text, deadline)
+    except UpstreamUnavailable as e:
+        print(f"Wikipedia unavailable: {e}")
     except Exception as e:
         print(f"Wikipedia error: {e}")
     return None
 
-def fact_check_text(text):
+def normalize_claim(claim):
+    claim = re.sub(r'[^\w\s]', '', claim.lower())
+    return re.sub(r'\s+', ' ', claim).strip()
+
+
+def claim_key(claim):
+    return hashlib.sha256(normalize_claim(claim).encode("utf-8")).hexdigest()
+
+
+def is_check_worthy(sentence):
+    """Keep declarative sentences that mention numbers or named entities"""
+    if sentence.endswith("?") or len(sentence.split()) < MIN_CLAIM_WORDS:
+        return False
+    has_number = re.search(r'\d', sentence) is not None
+    # Ignore the sentence-initial capital when looking for named entities
+    has_entity = re.search(r'(?<!^)\b[A-Z][a-z]+', sentence) is not None
+    return has_number or has_entity
+
+
+def extract_claims(text, max_claims=MAX_CLAIMS):
+    """Split text into deduplicated, check-worthy sentences"""
+    claims, seen = [], set()
+    for sentence in split_sentences(text):
+        sentence = sentence.strip()[:MAX_CLAIM_CHARS]
+        if not is_check_worthy(sentence):
+            continue
+        key = claim_key(sentence)
+        if key in seen:
+            continue
+        seen.add(key)
+        claims.append(sentence)
+        if len(claims) >= max_claims:
+            break
+    return claims
+
+
+def prepare_claims(text):
+    """Clean text and extract its claims; runs in the CPU pool for large inputs"""
     cleaned_text = clean_text(text)
-    fact_results = fetch_fact_check(cleaned_text)
-    wiki_result = search_wikipedia(cleaned_text)
+    claims = extract_claims(cleaned_text)
+    if not claims and cleaned_text:
+        # Fall back to the whole text so short inputs are still checked
+        claims = [cleaned_text[:MAX_CLAIM_CHARS]]
+    return claims
+
+
+@pipeline_stage("fact_check")
+def check_claim(claim, deadline=None):
+    """Check a single claim, returning a cached verdict when available and None once the request is gone"""
+    key = claim_key(claim)
+    with _claim_cache_lock:
+        cached = _claim_cache.get(key)
+        if cached is not None:
+            verdict, expires_at = cached
+            if expires_at is None or expires_at > time.monotonic():
+                _claim_cache.move_to_end(key)
+                return verdict
+            del _claim_cache[key]
+
+    # Queued checks of a finished or disconnected request must not spend upstream quota
+    if deadline is not None and deadline.expired():
+        return None
+
+    fact_results = fetch_fact_check(claim, deadline)
+    # Verdicts are only cached when every upstream consulted actually answered
+    upstream_failed = fact_results is None
+    wiki_result = None
+    if not fact_results:
+        try:
+            wiki_result = _search_wikipedia(claim, deadline)
+        except Exception as e:
+            print(f"Wikipedia error: {e}")
+            upstream_failed = True
 
     if fact_results:
-        
-        source = fact_results[0]["source"]
-        alert = fact_results[0]["verdict"]
-        confidence = 75  
+        verdict = {
+            "claim": claim,
+            "alert": fact_results[0]["verdict"],
+            "confidence": 75,
+            "source": fact_results[0]["source"]
+        }
     elif wiki_result:
-        source = wiki_result["source"]
-        alert = "Needs Verification"
-        confidence = 50
+        verdict = {
+            "claim": claim,
+            "alert": "Needs Verification",
+            "confidence": 50,
+            "source": wiki_result["source"]
+        }
+    else:
+        verdict = {"claim": claim, "alert": "No Data", "confidence": 0, "source": None}
+
+    if upstream_failed:
+        return verdict
+
+    expires_at = time.monotonic() + NEGATIVE_CACHE_TTL if verdict["alert"] == "No Data" else None
+    with _claim_cache_lock:
+        _claim_cache[key] = (verdict, expires_at)
+        _claim_cache.move_to_end(key)
+        while len(_claim_cache) > CLAIM_CACHE_SIZE:
+            _claim_cache.popitem(last=False)
+    return verdict
+
+
+@pipeline_stage("fact_check")
+def fact_check_text(text, deadline=None):
+    if not allows(deadline, "fact_check"):
+        return {"alert": "No Data", "confidence": 0, "source": None, "claims": [], "unchecked": 0, "skipped": True}
+
+    claims = run_cpu(prepare_claims, text, size=len(text))
+    futures = [_executor.submit(in_current_context(check_claim), claim, deadline) for claim in claims]
+    # Leave enough of the request budget for the analysis stage that follows
+    timeout = None if deadline is None else max(0.0, deadline.remaining() - STAGE_BUDGETS["analysis"])
+    done, not_done = wait(futures, timeout=timeout)
+    for future in not_done:
+        future.cancel()
+    verdicts = [verdict for verdict in (future.result() for future in futures if future in done) if verdict is not None]
+    checked = [v for v in verdicts if v["confidence"] > 0]
+
+    if checked:
+        best = max(checked, key=lambda v: v["confidence"])
+        alert = best["alert"]
+        source = best["source"]
+        confidence = round(sum(v["confidence"] for v in verdicts) / len(verdicts))
     else:
         source = None
         alert = "No Data"
@@ -86,5 +259,8 @@ def fact_check_text(text):
     return {
         "alert": alert,
         "confidence": confidence,
-        "source": source
+        "source": source,
+        "claims": verdicts,
+        # Claims dropped because the deadline or the client ran out before they were checked
+        "unchecked": len(claims) - len(verdicts)
     }
@@ -0,0 +1,266 @@
+import os
+import time
+import json
+import heapq
+import asyncio
+import hashlib
+import logging
+import contextvars
+import concurrent.futures
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+API_KEY_HEADER = b"x-api-key"
+
+# Number of reverse proxies in front of the app that append to X-Forwarded-For. Only
+# the entry the outermost of them added can be trusted; everything left of it is
+# whatever the client sent. 0 ignores the header and uses the socket peer address.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+# Per-client token bucket for the API endpoints
+CLIENT_RATE_PER_MINUTE = float(os.getenv("CLIENT_RATE_PER_MINUTE", "30"))
+CLIENT_BURST = float(os.getenv("CLIENT_BURST", "10"))
+RATE_LIMITED_PATHS = {"/analyze_text", "/url_summary", "/analyze_audio", "/check_url"}
+
+# Concurrent Groq calls shared across all clients of this worker
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))
+
+# Optional per-API-key weights, e.g. "key-a:4,key-b:0.5"; everyone else weighs 1
+CLIENT_WEIGHTS = {
+    key.strip(): float(weight)
+    for key, weight in (item.rsplit(":", 1) for item in os.getenv("CLIENT_WEIGHTS", "").split(",") if ":" in item)
+}
+
+# API keys that get their own client identity; any other key is ignored and the caller
+# is identified by IP, so made-up keys cannot mint fresh rate limits or queue shares
+API_KEYS = {key.strip() for key in os.getenv("API_KEYS", "").split(",") if key.strip()} | set(CLIENT_WEIGHTS)
+
+# Bound on how many distinct clients we keep counters for
+MAX_TRACKED_CLIENTS = 10000
+
+# Identity of the client behind the current request; asyncio.to_thread copies it into worker threads
+current_client = contextvars.ContextVar("current_client", default=None)
+
+
+class Client:
+    def __init__(self, client_id, weight):
+        self.id = client_id
+        self.weight = weight
+        self.tokens = CLIENT_BURST
+        self.refilled_at = time.monotonic()
+        self.requests = 0
+        self.rate_limited = 0
+        self.groq_calls = 0
+        self.groq_cost = 0.0
+        self.queue_wait = 0.0
+
+    def take_token(self):
+        now = time.monotonic()
+        self.tokens = min(CLIENT_BURST, self.tokens + (now - self.refilled_at) * CLIENT_RATE_PER_MINUTE / 60)
+        self.refilled_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def retry_after(self):
+        return max(1, int((1 - self.tokens) * 60 / CLIENT_RATE_PER_MINUTE) + 1)
+
+    def usage(self):
+        return {
+            "weight": self.weight,
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "groq_calls": self.groq_calls,
+            "groq_cost": round(self.groq_cost, 2),
+            "queue_wait": round(self.queue_wait, 3),
+        }
+
+
+_clients = OrderedDict()
+
+
+def client_ip(scope, forwarded_for):
+    """Caller IP, read from X-Forwarded-For only as far as trusted proxies vouch for it"""
+    hops = [hop.strip() for hop in ",".join(forwarded_for).split(",") if hop.strip()]
+    if TRUSTED_PROXY_HOPS > 0 and len(hops) >= TRUSTED_PROXY_HOPS:
+        return hops[-TRUSTED_PROXY_HOPS]
+    return (scope.get("client") or ("unknown",))[0]
+
+
+def identify(scope):
+    """Resolve the request to a Client by API key header, falling back to the caller's IP"""
+    api_key, forwarded_for = None, []
+    for name, value in scope.get("headers", []):
+        name = name.lower()
+        if name == API_KEY_HEADER:
+            api_key = value.decode("latin-1").strip()
+        elif name == b"x-forwarded-for":
+            forwarded_for.append(value.decode("latin-1"))
+
+    if api_key in API_KEYS:
+        # Counters are exposed, so never keep the raw key as the identifier
+        client_id = "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+        weight = CLIENT_WEIGHTS.get(api_key, 1.0)
+    else:
+        client_id = "ip:" + client_ip(scope, forwarded_for)
+        weight = 1.0
+
+    client = _clients.get(client_id)
+    if client is None:
+        client = _clients[client_id] = Client(client_id, weight)
+        if len(_clients) > MAX_TRACKED_CLIENTS:
+            _clients.popitem(last=False)
+    _clients.move_to_end(client_id)
+    return client
+
+
+def client_usage():
+    return {client_id: client.usage() for client_id, client in _clients.items()}
+
+
+class FairDispatcher:
+    """Weighted fair queueing (start-time fair queueing) for a shared pool of upstream slots.
+
+    Each call is tagged with start = max(virtual time, client's last finish) and the
+    client's finish moves on by cost / weight, so a client with many queued calls only
+    ever delays others by its fair share. All state lives on the event loop thread.
+    """
+
+    def __init__(self, max_concurrency=GROQ_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.virtual_time = 0.0
+        self.last_finish = {}
+        self.waiters = []
+        self.sequence = 0
+        self.loop = None
+
+    def _submit(self, client, cost, waiter):
+        client_id, weight = (client.id, client.weight) if client else (None, 1.0)
+        start = max(self.virtual_time, self.last_finish.get(client_id, 0.0))
+        self.last_finish[client_id] = start + cost / weight
+        if len(self.last_finish) > MAX_TRACKED_CLIENTS:
+            # Tags at or behind virtual time no longer affect ordering
+            self.last_finish = {k: v for k, v in self.last_finish.items() if v > self.virtual_time}
+        if client:
+            client.groq_calls += 1
+            client.groq_cost += cost
+
+        self.sequence += 1
+        heapq.heappush(self.waiters, (start, self.sequence, waiter))
+        self._grant()
+
+    def _grant(self):
+        while self.waiters and self.active < self.max_concurrency:
+            start, _, waiter = heapq.heappop(self.waiters)
+            if isinstance(waiter, concurrent.futures.Future):
+                # Atomically claims the waiter unless its thread already gave up
+                if not waiter.set_running_or_notify_cancel():
+                    continue
+            elif waiter.cancelled():
+                continue
+            self.active += 1
+            self.virtual_time = max(self.virtual_time, start)
+            waiter.set_result(None)
+
+    def release(self):
+        self.active -= 1
+        self._grant()
+
+    def saturated(self):
+        """True when a new call would have to queue for a slot"""
+        return bool(self.waiters) or self.active >= self.max_concurrency
+
+    async def acquire(self, client, cost=1.0):
+        self.loop = asyncio.get_running_loop()
+        queued_at = time.monotonic()
+        waiter = self.loop.create_future()
+        self._submit(client, cost, waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Granted a slot just as we were cancelled: hand it on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if client:
+                client.queue_wait += time.monotonic() - queued_at
+
+    @asynccontextmanager
+    async def slot(self, cost=1.0, queue_timeout=None):
+        await asyncio.wait_for(self.acquire(current_client.get(), cost), queue_timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def run_sync(self, fn, *args, cost=1.0, queue_timeout=None, **kwargs):
+        """Run a blocking call from a worker thread once the event loop grants a slot"""
+        if self.loop is None or not self.loop.is_running():
+            return fn(*args, **kwargs)
+
+        client = current_client.get()
+        queued_at = time.monotonic()
+        waiter = concurrent.futures.Future()
+        self.loop.call_soon_threadsafe(self._submit, client, cost, waiter)
+        try:
+            waiter.result(timeout=queue_timeout)
+        except concurrent.futures.TimeoutError:
+            # cancel() fails once the slot was granted, and then it must be given back
+            if not waiter.cancel():
+                self.loop.call_soon_threadsafe(self.release)
+            raise
+        finally:
+            if client:
+                client.queue_wait += time.monotonic() - queued_at
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.loop.call_soon_threadsafe(self.release)
+
+
+groq_dispatcher = FairDispatcher()
+
+
+def estimate_cost(text):
+    """Queueing cost of one Groq call, in thousands of estimated tokens"""
+    return max(0.1, len(text) / 4000)
+
+
+class ClientMiddleware:
+    """Identify the caller, enforce its rate limit and expose it to downstream Groq calls"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        client = identify(scope)
+        groq_dispatcher.loop = asyncio.get_running_loop()
+        if scope["path"] in RATE_LIMITED_PATHS:
+            client.requests += 1
+            if not client.take_token():
+                client.rate_limited += 1
+                await send({
+                    "type": "http.response.start",
+                    "status": 429,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"retry-after", str(client.retry_after()).encode("latin-1")),
+                    ]
+                })
+                await send({"type": "http.response.body", "body": json.dumps({"detail": "Rate limit exceeded"}).encode()})
+                return
+
+        token = current_client.set(client)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_client.reset(token)
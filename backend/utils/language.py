@@ -5,6 +5,9 @@ import pycountry
 from pydantic import BaseModel
 import langid
 from typing import Optional
+from utils.deadline import allows
+from utils.executor import run_cpu
+from utils.profiler import pipeline_stage
 
 class ProcessedText(BaseModel):
     translated: str
@@ -161,14 +164,16 @@ def detect_language(text):
         langid_lang, langid_confidence = langid.classify(text)
         return langid_lang, langid_confidence
 
-def translate_language(text, target_language="en"):
+@pipeline_stage("translation")
+def translate_language(text, target_language="en", deadline=None):
     """Translate text with enhanced language detection"""
-    # Detect the language
-    detected_lang, confidence = detect_language(text)
+    # Detect the language, in the CPU pool for long transcripts
+    with pipeline_stage("language_detection"):
+        detected_lang, confidence = run_cpu(detect_language, text, size=len(text))
     language_name = get_language_name(detected_lang)
     
-    # If already in target language, just return the original
-    if detected_lang == target_language:
+    # If already in target language, or there is no time left to translate, return the original
+    if detected_lang == target_language or not allows(deadline, "translation"):
         return ProcessedText(
             translated=text,
             language=language_name
@@ -0,0 +1,203 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Context windows in tokens, used to skip models an input would not fit
+MODEL_CONTEXT = {
+    "llama-3.3-70b-versatile": 128000,
+    "llama3-70b-8192": 8192,
+    "llama-3.1-8b-instant": 128000,
+    "llama3-8b-8192": 8192,
+}
+
+# A preferred model is skipped once its recent p95 goes above this many seconds
+LATENCY_SLO = float(os.getenv("MODEL_LATENCY_SLO", "8"))
+
+# Rolling latency window per model
+WINDOW_SIZE = 200
+WINDOW_SECONDS = 300
+MIN_SAMPLES = 20
+
+# The hedge fires when the first model is slower than this percentile of its recent latency
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "90"))
+HEDGE_DEFAULT_DELAY = 2.0
+HEDGE_MIN_DELAY = 0.25
+HEDGE_MAX_DELAY = 10.0
+
+# Room left in the context window for the prompt template and the reply
+RESERVED_TOKENS = 1200
+
+
+def estimate_tokens(chars):
+    return chars // 4 + 1
+
+
+class LatencyWindow:
+    """Latencies from the last WINDOW_SECONDS, capped at WINDOW_SIZE samples.
+
+    A censored sample is a call cancelled after losing a hedge: all we know is that it
+    was slower than the elapsed time, so it is never used as that latency.
+    """
+
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW_SIZE)
+        self.lock = threading.Lock()
+
+    def record(self, seconds, censored=False):
+        with self.lock:
+            self.samples.append((time.monotonic(), seconds, censored))
+
+    def _current(self):
+        cutoff = time.monotonic() - WINDOW_SECONDS
+        with self.lock:
+            while self.samples and self.samples[0][0] < cutoff:
+                self.samples.popleft()
+            return list(self.samples)
+
+    def percentile(self, p, censored_as_slowest=False):
+        """Percentile of completed calls; optionally counting censored calls as slower than all of them"""
+        samples = self._current()
+        values = sorted(seconds for _, seconds, censored in samples if not censored)
+        if censored_as_slowest:
+            values += [float("inf")] * (len(samples) - len(values))
+        if len(values) < MIN_SAMPLES:
+            return None
+        return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+    def count(self):
+        with self.lock:
+            return len(self.samples)
+
+    def censored(self):
+        with self.lock:
+            return sum(1 for _, _, censored in self.samples if censored)
+
+
+class ModelRouter:
+    def __init__(self):
+        self.windows = {}
+        self.lock = threading.Lock()
+        self.routed = 0
+        self.hedge_eligible = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def window(self, model):
+        with self.lock:
+            if model not in self.windows:
+                self.windows[model] = LatencyWindow()
+            return self.windows[model]
+
+    def record(self, model, seconds):
+        self.window(model).record(seconds)
+
+    def p95(self, model):
+        """p95 for routing: lost hedges count as slower than any completed call, so a model
+        that keeps losing them goes over LATENCY_SLO and is demoted"""
+        return self.window(model).percentile(95, censored_as_slowest=True)
+
+    def _ranked(self, chars, candidates):
+        """Candidates that fit the input, healthy ones first in preference order, then by p95"""
+        needed = estimate_tokens(chars) + RESERVED_TOKENS
+        fits = [m for m in candidates if MODEL_CONTEXT.get(m, 8192) >= needed]
+        if not fits:
+            fits = [max(candidates, key=lambda m: MODEL_CONTEXT.get(m, 8192))]
+        p95s = {m: self.p95(m) for m in fits}
+        healthy = [m for m in fits if p95s[m] is None or p95s[m] <= LATENCY_SLO]
+        slow = sorted((m for m in fits if m not in healthy), key=lambda m: p95s[m])
+        return healthy + slow
+
+    def choose(self, chars, candidates):
+        """Pick the model for one call from input size and recent p95 latency"""
+        self.routed += 1
+        return self._ranked(chars, candidates)[0]
+
+    def hedge_delay(self, model):
+        delay = self.window(model).percentile(HEDGE_PERCENTILE)
+        if delay is None:
+            return HEDGE_DEFAULT_DELAY
+        return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, delay))
+
+    async def hedged(self, call, chars, candidates, deadline=None, busy=None):
+        """Run call(model, started) on the best model, duplicating it to the runner-up if it is slow.
+
+        call must set the asyncio.Event started once its request is actually sent; the
+        hedge delay is measured from there, like the latencies it is derived from, so
+        time spent queued for a slot never triggers a hedge. No hedge is sent while
+        busy() is true, since it would only queue too. The first successful result wins
+        and the other request is cancelled. A model that fails outright hands over to
+        the other one instead of failing the call.
+        """
+        ranked = self._ranked(chars, candidates)
+        self.routed += 1
+        started = asyncio.Event()
+        primary = asyncio.ensure_future(call(ranked[0], started))
+        secondary = None
+        try:
+            if len(ranked) < 2:
+                return await primary
+            self.hedge_eligible += 1
+
+            sent = asyncio.ensure_future(started.wait())
+            try:
+                await asyncio.wait({primary, sent}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                sent.cancel()
+            sent_at = time.monotonic()
+
+            delay = self.hedge_delay(ranked[0])
+            if not primary.done():
+                if (busy is not None and busy()) or (deadline is not None and deadline.remaining() <= delay):
+                    return await primary
+                await asyncio.wait({primary}, timeout=delay)
+            if primary.done() and primary.exception() is None:
+                return primary.result()
+
+            self.hedges += 1
+            logger.info(f"Hedging {ranked[0]} with {ranked[1]} after {delay:.2f}s")
+            secondary = asyncio.ensure_future(call(ranked[1], asyncio.Event()))
+            pending = {primary, secondary} - {task for task in (primary,) if task.done()}
+            last_error = primary.exception() if primary.done() else None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is secondary:
+                            self.hedge_wins += 1
+                            if not primary.done() and started.is_set():
+                                # The cancelled primary records nothing itself; keep the loss as a lower bound
+                                self.window(ranked[0]).record(time.monotonic() - sent_at, censored=True)
+                        return task.result()
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            # Cancel the loser (or both, if we were cancelled ourselves)
+            for task in (primary, secondary):
+                if task is not None:
+                    task.cancel()
+
+    def stats(self):
+        return {
+            "routed": self.routed,
+            "hedge_eligible": self.hedge_eligible,
+            "hedges": self.hedges,
+            "hedge_rate": round(self.hedges / self.hedge_eligible, 3) if self.hedge_eligible else 0.0,
+            "hedge_win_rate": round(self.hedge_wins / self.hedges, 3) if self.hedges else 0.0,
+            "models": {
+                model: {
+                    "samples": window.count(),
+                    "hedge_losses": window.censored(),
+                    "p50": window.percentile(50),
+                    "p95": window.percentile(95),
+                }
+                for model, window in list(self.windows.items())
+            }
+        }
+
+
+model_router = ModelRouter()
@@ -0,0 +1,177 @@
+import os
+import sys
+import hmac
+import uuid
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Profiling is disabled unless an admin token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+ADMIN_HEADER = b"x-admin-token"
+TRACE_HEADER = b"x-profile-trace"
+
+SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+MAX_PROFILE_SECONDS = 60
+MAX_STORED_TRACES = 20
+
+# Thread id -> (pipeline stage, trace id); read by the sampler, written by pipeline_stage
+_thread_stages = {}
+# Waits on the event loop thread, which is shared by every request: key -> (stage, trace id, label)
+_awaited_stages = {}
+_traces = OrderedDict()
+
+# Trace id of the profiled request, copied into worker threads by asyncio.to_thread;
+# plain executor.submit does not copy it, so those callers wrap with in_current_context
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def is_admin(token):
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode() if isinstance(token, str) else token, ADMIN_TOKEN.encode())
+
+
+@contextmanager
+def pipeline_stage(name):
+    """Tag the current thread with a pipeline stage so samples can be attributed to it"""
+    ident = threading.get_ident()
+    previous = _thread_stages.get(ident)
+    _thread_stages[ident] = (name, current_trace.get())
+    try:
+        yield
+    finally:
+        if previous is None:
+            _thread_stages.pop(ident, None)
+        else:
+            _thread_stages[ident] = previous
+
+
+@contextmanager
+def awaited_stage(name, label):
+    """Tag time a coroutine spends awaiting I/O; the sampler counts one sample per tick for it.
+
+    Coroutines share the event loop thread, so they cannot be tagged by thread like
+    pipeline_stage does, and an idle await shows up in no thread's stack anyway.
+    """
+    key = object()
+    _awaited_stages[key] = (name, current_trace.get(), label)
+    try:
+        yield
+    finally:
+        _awaited_stages.pop(key, None)
+
+
+def _run_in_stage(stage, fn, args, kwargs):
+    with pipeline_stage(stage):
+        return fn(*args, **kwargs)
+
+
+def in_current_context(fn):
+    """Wrap fn for executor.submit so it runs with the caller's context vars and pipeline stage"""
+    context = contextvars.copy_context()
+    stage = _thread_stages.get(threading.get_ident(), ("untagged", None))[0]
+
+    def run(*args, **kwargs):
+        return context.run(_run_in_stage, stage, fn, args, kwargs)
+    return run
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+class Sampler(threading.Thread):
+    """Samples every thread's stack at a fixed interval into collapsed-stack counts.
+
+    Only threads of this process are seen. Work sent to the CPU process pool
+    (utils.executor) shows up as the calling thread waiting on its result under
+    the caller's stage, not as the parsing or ranking frames themselves.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, trace_id=None):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.interval = interval
+        self.trace_id = trace_id
+        self.counts = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == self.ident:
+                    continue
+                stage, trace_id = _thread_stages.get(ident, ("untagged", None))
+                if self.trace_id is not None and trace_id != self.trace_id:
+                    continue
+                self.counts[f"[{stage}];{_collapse(frame)}"] += 1
+            for stage, trace_id, label in list(_awaited_stages.values()):
+                if self.trace_id is not None and trace_id != self.trace_id:
+                    continue
+                self.counts[f"[{stage}];{label}"] += 1
+            self.samples += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self):
+        """Brendan Gregg collapsed-stack format, ready for flamegraph.pl or speedscope"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.counts.most_common())
+
+
+def store_trace(trace_id, sampler):
+    _traces[trace_id] = sampler.collapsed()
+    while len(_traces) > MAX_STORED_TRACES:
+        _traces.popitem(last=False)
+
+
+def get_trace(trace_id):
+    return _traces.get(trace_id)
+
+
+class ProfilerMiddleware:
+    """Profile just the requests an admin marks with the X-Profile-Trace header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMIN_TOKEN:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        if TRACE_HEADER not in headers or not is_admin(headers.get(ADMIN_HEADER)):
+            await self.app(scope, receive, send)
+            return
+
+        trace_id = uuid.uuid4().hex[:16]
+        sampler = Sampler(trace_id=trace_id)
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", trace_id.encode())]}
+            await send(message)
+
+        token = current_trace.set(trace_id)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            current_trace.reset(token)
+            # stop() joins the sampler thread, which must not block the event loop
+            await asyncio.to_thread(sampler.stop)
+            store_trace(trace_id, sampler)
+            logger.info(f"Stored profile {trace_id} for {scope['path']} ({sampler.samples} samples)")
@@ -0,0 +1,176 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from utils.deadline import call_timeout
+from utils.profiler import in_current_context
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Bound on how many per-host circuit breakers a HostUpstream keeps
+MAX_TRACKED_HOSTS = 1024
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when an upstream call is rejected, times out or fails"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single probe through after reset_timeout"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def release_probe(self):
+        with self.lock:
+            self.probing = False
+
+    def record_success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+class Upstream:
+    """Bulkhead (own worker pool and concurrency limit), timeout and circuit breaker for one dependency"""
+
+    def __init__(self, name, max_concurrency=4, timeout=5.0, failure_threshold=5, reset_timeout=30.0):
+        prefix = f"UPSTREAM_{name.upper()}_"
+        self.name = name
+        self.max_concurrency = int(os.getenv(prefix + "CONCURRENCY", max_concurrency))
+        self.timeout = float(os.getenv(prefix + "TIMEOUT", timeout))
+        self.breaker = CircuitBreaker(
+            int(os.getenv(prefix + "FAILURE_THRESHOLD", failure_threshold)),
+            float(os.getenv(prefix + "RESET_TIMEOUT", reset_timeout))
+        )
+        self.slots = threading.BoundedSemaphore(self.max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix=f"upstream-{name}")
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn in this upstream's bulkhead, raising UpstreamUnavailable instead of hanging"""
+        return self._call(self.breaker, self.name, None, fn, *args, **kwargs)
+
+    def call_within(self, deadline, fn, *args, **kwargs):
+        """Like call, but never starts once the request deadline has passed or its client has gone"""
+        return self._call(self.breaker, self.name, deadline, fn, *args, **kwargs)
+
+    def _call(self, breaker, label, deadline, fn, *args, **kwargs):
+        if deadline is not None and deadline.expired():
+            raise UpstreamUnavailable(f"{label}: request deadline reached")
+        if not breaker.allow():
+            raise UpstreamUnavailable(f"{label}: circuit open")
+        if not self.slots.acquire(blocking=False):
+            # Rejections are load, not failure, so the breaker is not told about them,
+            # but a half-open probe that never ran must not block future probes
+            breaker.release_probe()
+            raise UpstreamUnavailable(f"{label}: bulkhead full")
+
+        # The slot is held until the work really finishes, so a hung upstream fills only its own bulkhead
+        future = self.executor.submit(in_current_context(fn), *args, **kwargs)
+        future.add_done_callback(lambda _: self.slots.release())
+        timeout = call_timeout(deadline, self.timeout)
+        try:
+            result = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Running out of request budget says nothing about the upstream's health
+            if timeout >= self.timeout:
+                breaker.record_failure()
+            else:
+                breaker.release_probe()
+            logger.warning(f"Upstream {label} timed out after {timeout:.1f}s")
+            raise UpstreamUnavailable(f"{label}: timed out")
+        except Exception as e:
+            breaker.record_failure()
+            raise UpstreamUnavailable(f"{label}: {e}") from e
+        breaker.record_success()
+        return result
+
+    def status(self):
+        return {
+            "state": self.breaker.state,
+            "failures": self.breaker.failures,
+            "max_concurrency": self.max_concurrency,
+            "timeout": self.timeout
+        }
+
+
+class HostUpstream(Upstream):
+    """Upstream that fronts many independent hosts: one shared bulkhead, but a circuit breaker per host,
+    so dead or slow sites only ever open their own breaker"""
+
+    def __init__(self, name, **kwargs):
+        super().__init__(name, **kwargs)
+        self.host_breakers = OrderedDict()
+        self.hosts_lock = threading.Lock()
+
+    def breaker_for(self, host):
+        with self.hosts_lock:
+            breaker = self.host_breakers.get(host)
+            if breaker is None:
+                breaker = self.host_breakers[host] = CircuitBreaker(
+                    self.breaker.failure_threshold, self.breaker.reset_timeout
+                )
+                if len(self.host_breakers) > MAX_TRACKED_HOSTS:
+                    self.host_breakers.popitem(last=False)
+            self.host_breakers.move_to_end(host)
+            return breaker
+
+    def call_host(self, host, deadline, fn, *args, **kwargs):
+        """Like call_within, but failures only count against the given host's breaker"""
+        return self._call(self.breaker_for(host), f"{self.name} ({host})", deadline, fn, *args, **kwargs)
+
+    def status(self):
+        with self.hosts_lock:
+            open_hosts = sorted(host for host, breaker in self.host_breakers.items() if breaker.state != CLOSED)
+        return {
+            "tracked_hosts": len(self.host_breakers),
+            "open_hosts": open_hosts[:20],
+            "max_concurrency": self.max_concurrency,
+            "timeout": self.timeout
+        }
+
+
+fact_check_api = Upstream("fact_check", max_concurrency=8, timeout=5.0)
+wikipedia_api = Upstream("wikipedia", max_concurrency=8, timeout=6.0)
+safe_browsing_api = Upstream("safe_browsing", max_concurrency=8, timeout=4.0)
+youtube_api = Upstream("youtube", max_concurrency=4, timeout=20.0)
+# Users choose which sites we fetch, so breakers are per host; only transport errors count
+webpage_fetch = HostUpstream("webpage", max_concurrency=8, timeout=15.0)
+
+UPSTREAMS = [fact_check_api, wikipedia_api, safe_browsing_api, youtube_api, webpage_fetch]
+
+
+def upstream_status():
+    return {upstream.name: upstream.status() for upstream in UPSTREAMS}
@@ -1,5 +1,8 @@
 from groq import Groq
 import os
+import asyncio
+from utils.deadline import call_timeout
+from utils.profiler import pipeline_stage
 from fastapi import UploadFile, HTTPException
 api_key = os.getenv("GROQ_API_KEY")
 if not api_key:
@@ -9,15 +12,17 @@ client = Groq(api_key=api_key)
 
 MAX_FILE_SIZE = 25 * 1024 * 1024  # 25 MB
 
-async def transcribe(file: UploadFile):
+async def transcribe(file: UploadFile, deadline=None):
     contents = await file.read()
     if len(contents) > MAX_FILE_SIZE:
         raise HTTPException(status_code=413, detail="File too large for transcription service.")
     
     
-    transcription = client.audio.transcriptions.create(
+    transcription = await asyncio.to_thread(
+        pipeline_stage("transcription")(client.audio.transcriptions.create),
         file=(file.filename, contents),
         model="distil-whisper-large-v3-en",
         response_format="verbose_json",
+        timeout=call_timeout(deadline, 60.0),
     )
     return {"transcript": transcription.text}
\ No newline at end of file
@@ -2,6 +2,7 @@ import validators
 import requests
 from dotenv import load_dotenv
 import os
+from utils.resilience import safe_browsing_api, UpstreamUnavailable
 
 load_dotenv()
 API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -23,7 +24,7 @@ def is_url_safe_google(url, api_key=API_KEY):
         }
     }
 
-    response = requests.post(endpoint, json=body)
+    response = requests.post(endpoint, json=body, timeout=safe_browsing_api.timeout)
     result = response.json()
     return result == {}  # True if safe, False if threats found
 
@@ -35,7 +36,11 @@ def is_valid_url(url):
     
 def check_url(url):
     if is_valid_url(url):
-        return is_url_safe_google(url)
+        try:
+            return safe_browsing_api.call(is_url_safe_google, url)
+        except UpstreamUnavailable as e:
+            print(f"Safe Browsing unavailable: {e}")
+            return "Unknown"
     else:
         return "Invalid URL"
 
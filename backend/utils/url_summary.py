@@ -1,11 +1,21 @@
 import re
 import time
+import socket
+import threading
 import requests
+import concurrent.futures
 import urllib.parse  # Missing import for the webpage function
 from youtube_transcript_api import YouTubeTranscriptApi
 import wikipediaapi
 from bs4 import BeautifulSoup
 import os
+from utils.extractive import reduce_text
+from utils.resilience import webpage_fetch, wikipedia_api, youtube_api
+from utils.deadline import allows, call_timeout, STAGE_BUDGETS
+from utils.executor import run_cpu
+from utils.fair_queue import groq_dispatcher, estimate_cost
+from utils.profiler import pipeline_stage
+from utils.model_router import model_router
 
 # Load environment
 from dotenv import load_dotenv
@@ -14,6 +24,15 @@ load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_API_ENDPOINT = "https://api.groq.com/openai/v1/chat/completions"  # API endpoint was missing
 
+# Token budget for the local extractive pre-reduction stage (0 disables it)
+EXTRACTIVE_TOKEN_BUDGET = int(os.getenv("EXTRACTIVE_TOKEN_BUDGET", "6000"))
+
+# Webpage downloads are capped in total time and size, not just per socket read
+MAX_PAGE_BYTES = int(os.getenv("MAX_PAGE_BYTES", str(5 * 1024 * 1024)))
+
+# Summary models in order of preference; the router picks per call from input size and recent p95
+SUMMARY_MODELS = os.getenv("SUMMARY_MODELS", "llama3-8b-8192,llama-3.1-8b-instant").split(",")
+
 # Prompts
 chunk_prompt = """You are summarizing a part of a larger content. Summarize this section concisely, focusing on key facts, arguments, and information. Don't try to introduce or conclude the entire topic, just focus on this specific section:
 
@@ -120,7 +139,39 @@ def get_url_type(url: str) -> str:
     return "webpage"
 
 
-def extract_transcript_details(youtube_video_url):
+def _fetch_transcript(video_id):
+    """Fetch a video's transcript, or None when it has no usable captions"""
+    try:
+        transcript_text = YouTubeTranscriptApi.get_transcript(video_id)
+    except requests.exceptions.RequestException:
+        # Network trouble counts against the upstream, unlike a video without captions
+        raise
+    except Exception:
+        # Try to get transcript with auto-translation if available
+        try:
+            transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
+            # Try to find manual transcripts first
+            for transcript in transcript_list:
+                if not transcript.is_generated:
+                    # Prefer manual transcripts
+                    transcript_text = transcript.fetch()
+                    break
+            else:
+                # If no manual transcript found, use the first available
+                transcript_text = transcript_list[0].fetch()
+        except requests.exceptions.RequestException:
+            raise
+        except Exception:
+            return None
+
+    # Build the transcript text
+    transcript = ""
+    for i in transcript_text:
+        transcript += " " + i["text"]
+    return transcript
+
+
+def extract_transcript_details(youtube_video_url, deadline=None):
     try:
         if "youtube.com" in youtube_video_url and "=" in youtube_video_url:
             video_id = youtube_video_url.split("=")[1]
@@ -135,38 +186,23 @@ def extract_transcript_details(youtube_video_url):
         else:
             return None, None, "Invalid YouTube URL format"
             
-        try:
-            transcript_text = YouTubeTranscriptApi.get_transcript(video_id)
-            transcript = ""
-            for i in transcript_text:
-                transcript += " " + i["text"]
-            return transcript, video_id, None
-        except Exception as te:
-            # Try to get transcript with auto-translation if available
-            try:
-                transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
-                # Try to find manual transcripts first
-                for transcript in transcript_list:
-                    if not transcript.is_generated:
-                        # Prefer manual transcripts
-                        transcript_text = transcript.fetch()
-                        break
-                else:
-                    # If no manual transcript found, use the first available
-                    transcript_text = transcript_list[0].fetch()
-                
-                # Build the transcript text
-                transcript = ""
-                for i in transcript_text:
-                    transcript += " " + i["text"]
-                return transcript, video_id, None
-            except:
-                return None, None, f"Could not retrieve transcript for video ID: {video_id}. The video might not have captions or they might be disabled."
+        transcript = youtube_api.call_within(deadline, _fetch_transcript, video_id)
+        if transcript is None:
+            return None, None, f"Could not retrieve transcript for video ID: {video_id}. The video might not have captions or they might be disabled."
+        return transcript, video_id, None
     except Exception as e:
         return None, None, f"Error extracting YouTube transcript: {str(e)}"
 
 
-def extract_wikipedia_content(wikipedia_url):
+def _fetch_wikipedia_article(title):
+    """Return the article text, or None when the page does not exist"""
+    # Initialize Wikipedia API
+    wiki_wiki = wikipediaapi.Wikipedia('WikiSummarizerApp/1.0', 'en')
+    page = wiki_wiki.page(title)
+    return page.text if page.exists() else None
+
+
+def extract_wikipedia_content(wikipedia_url, deadline=None):
     try:
         # Extract the title from the URL
         title_match = re.search(r'wikipedia\.org/wiki/(.+)', wikipedia_url)
@@ -176,47 +212,90 @@ def extract_wikipedia_content(wikipedia_url):
         title = title_match.group(1)
         title = title.replace('_', ' ')
         
-        # Initialize Wikipedia API
-        wiki_wiki = wikipediaapi.Wikipedia('WikiSummarizerApp/1.0', 'en')
-        page = wiki_wiki.page(title)
-        
-        if not page.exists():
+        text = wikipedia_api.call_within(deadline, _fetch_wikipedia_article, title)
+        if text is None:
             return None, None, f"Wikipedia page '{title}' does not exist or could not be found."
             
-        return page.text, title, None
+        return text, title, None
     except Exception as e:
         return None, None, f"Error extracting Wikipedia content: {str(e)}"
     
     
-def extract_webpage_content(url):
+def parse_html(html: str) -> tuple:
+    """Extract (text, title) from an HTML document; runs in the CPU pool for large pages"""
+    # Parse the HTML content
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # Extract title as a plain str so it pickles without the parse tree
+    title = str(soup.title.string) if soup.title and soup.title.string else "No title found"
+        
+    # Remove script, style elements and comments
+    for element in soup(['script', 'style', 'header', 'footer', 'nav', 'aside']):
+        element.decompose()
+        
+    # Extract text from paragraphs, headings, and lists
+    content_elements = soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li'])
+    
+    content = []
+    for element in content_elements:
+        text = element.get_text(strip=True)
+        if text and len(text) > 20:  # Filter out very short texts
+            content.append(text)
+            
+    # Join all paragraphs with newlines
+    return "\n\n".join(content), title
+
+
+def _abort_download(response):
+    """Shut the socket under a streaming response so a read blocked on a trickling host returns"""
+    connection = getattr(response.raw, "connection", None) or getattr(response.raw, "_connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def _download_page(url, headers, timeout):
+    """GET a page, returning (response, html); gives up once the whole download exceeds timeout"""
+    started = time.monotonic()
+    with requests.get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if response.status_code >= 400:
+            return response, None
+        # The requests timeout only bounds each socket read, so a watchdog enforces the total
+        watchdog = threading.Timer(max(0.0, timeout - (time.monotonic() - started)), _abort_download, (response,))
+        watchdog.daemon = True
+        watchdog.start()
+        chunks, size = [], 0
+        try:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= MAX_PAGE_BYTES:
+                    break
+        except requests.exceptions.RequestException:
+            if time.monotonic() - started >= timeout:
+                raise requests.exceptions.Timeout(f"Download took longer than {timeout:.1f}s")
+            raise
+        finally:
+            watchdog.cancel()
+        if time.monotonic() - started >= timeout:
+            raise requests.exceptions.Timeout(f"Download took longer than {timeout:.1f}s")
+        html = b"".join(chunks)[:MAX_PAGE_BYTES].decode(response.encoding or "utf-8", errors="replace")
+    return response, html
+
+
+def extract_webpage_content(url, deadline=None):
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        response = requests.get(url, headers=headers, timeout=15)
+        host = urllib.parse.urlparse(url).netloc.lower()
+        response, html = webpage_fetch.call_host(host, deadline, _download_page, url, headers, call_timeout(deadline, webpage_fetch.timeout))
         response.raise_for_status()  # Raise exception for 4XX/5XX responses
         
-        # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Extract title
-        title = soup.title.string if soup.title else "No title found"
-        
-        # Remove script, style elements and comments
-        for element in soup(['script', 'style', 'header', 'footer', 'nav', 'aside']):
-            element.decompose()
-            
-        # Extract text from paragraphs, headings, and lists
-        content_elements = soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li'])
-        
-        content = []
-        for element in content_elements:
-            text = element.get_text(strip=True)
-            if text and len(text) > 20:  # Filter out very short texts
-                content.append(text)
-                
-        # Join all paragraphs with newlines
-        full_text = "\n\n".join(content)
+        full_text, title = run_cpu(parse_html, html, size=len(html))
         
         # Get the webpage favicon or domain icon
         domain = urllib.parse.urlparse(url).netloc
@@ -227,62 +306,127 @@ def extract_webpage_content(url):
         return None, None, f"Error extracting webpage content: {str(e)}"
 
 
-def generate_groq_content(text: str, prompt: str, api_key: str, model: str="llama3-8b-8192") -> str:
-    # Default to smaller model to avoid token limits
+def _timed_post(model: str, *args, **kwargs):
+    """POST to Groq and feed the latency into the model router.
+
+    Same sampling rule as analyze_content.query_groq: successful responses and
+    transport failures count; fast rejections such as 429 or 413 would not
+    reflect the model's speed and are skipped.
+    """
+    started = time.monotonic()
     try:
-        resp = requests.post(
-            GROQ_API_ENDPOINT,
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            },
-            json={
-                "model": model,
-                "messages": [
-                    {"role": "system", "content": "Summarize."},
-                    {"role": "user", "content": prompt+text}
-                ],
-                "temperature": 0.3,
-                "max_tokens": 800  # Reduced to stay within limits
-            }
-        )
-        if resp.status_code == 200: 
-            return resp.json()["choices"][0]["message"]["content"]
-        if resp.status_code == 429: 
-            time.sleep(5)
-            return generate_groq_content(text, prompt, api_key, model)
-        if resp.status_code == 413:  # Request too large
-            # If the request is too large, try to split it further or use a smaller model
-            if model != "llama3-8b-8192":
-                # Try with the smaller model
-                return generate_groq_content(text, prompt, api_key, "llama3-8b-8192")
-            elif len(text) > 2000:
-                # If already using the smallest model and text is still too large, truncate
-                return generate_groq_content(text[:2000], prompt + " (text was truncated due to size) ", api_key, model)
-            else:
-                return "Error: Content too large for API limits even after reduction attempts."
-        return f"Error {resp.status_code}: {resp.text}"
+        resp = requests.post(*args, **kwargs)
+    except requests.exceptions.RequestException:
+        model_router.record(model, time.monotonic() - started)
+        raise
+    if resp.status_code == 200:
+        model_router.record(model, time.monotonic() - started)
+    return resp
+
+
+class SummaryError(Exception):
+    """A Groq summary call failed; the message says why"""
+
+
+def _groq_summary(text: str, prompt: str, api_key: str, model: str=None, deadline=None) -> str:
+    """Summarize with Groq, raising SummaryError instead of returning an error string"""
+    # Let the router pick a model that fits the input and is answering quickly
+    if model is None:
+        model = model_router.choose(len(prompt) + len(text), SUMMARY_MODELS)
+    try:
+        with pipeline_stage("groq_wait"):
+            # Queue behind other clients' Groq calls in weighted fair order
+            resp = groq_dispatcher.run_sync(
+                _timed_post,
+                model,
+                GROQ_API_ENDPOINT,
+                headers={
+                    "Authorization": f"Bearer {api_key}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": model,
+                    "messages": [
+                        {"role": "system", "content": "Summarize."},
+                        {"role": "user", "content": prompt+text}
+                    ],
+                    "temperature": 0.3,
+                    "max_tokens": 800  # Reduced to stay within limits
+                },
+                timeout=call_timeout(deadline, 60.0),
+                cost=estimate_cost(prompt + text),
+                queue_timeout=None if deadline is None else deadline.remaining()
+            )
+    except concurrent.futures.TimeoutError:
+        raise SummaryError("Error: request deadline reached while queued for Groq")
     except Exception as e:
-        return f"Error processing content: {str(e)}"
+        raise SummaryError(f"Error processing content: {str(e)}") from e
 
+    if resp.status_code == 200: 
+        return resp.json()["choices"][0]["message"]["content"]
+    if resp.status_code == 429: 
+        # Only wait out the rate limit if the request can still afford it
+        if deadline is not None and deadline.remaining() < 5 + STAGE_BUDGETS["summarization"]:
+            raise SummaryError("Error 429: rate limited and request deadline too close to retry")
+        time.sleep(5)
+        return _groq_summary(text, prompt, api_key, model, deadline)
+    if resp.status_code == 413:  # Request too large
+        # If the request is too large, try to split it further or use a smaller model
+        if model != "llama3-8b-8192":
+            # Try with the smaller model
+            return _groq_summary(text, prompt, api_key, "llama3-8b-8192", deadline)
+        elif len(text) > 2000:
+            # If already using the smallest model and text is still too large, truncate
+            return _groq_summary(text[:2000], prompt + " (text was truncated due to size) ", api_key, model, deadline)
+        else:
+            raise SummaryError("Error: Content too large for API limits even after reduction attempts.")
+    raise SummaryError(f"Error {resp.status_code}: {resp.text}")
+
+
+def generate_groq_content(text: str, prompt: str, api_key: str, model: str=None, deadline=None) -> str:
+    """Summarize with Groq, returning the error text on failure"""
+    try:
+        return _groq_summary(text, prompt, api_key, model, deadline)
+    except SummaryError as e:
+        return str(e)
 
-def process_large_content(text: str, utype: str, api_key: str) -> str:
-    # Split into smaller chunks to avoid API limits
-    chunks = split_into_chunks(text, max_chunk_size=2000)
+
+def process_large_content(text: str, utype: str, api_key: str, token_budget: int = EXTRACTIVE_TOKEN_BUDGET, deadline=None) -> tuple:
+    """Map-reduce summarize text; returns (summary, partial) where partial means some chunks are missing.
+
+    Raises SummaryError when no chunk could be summarized at all.
+    """
+    # Keep only the most central sentences before paying for LLM calls
+    with pipeline_stage("chunking"):
+        if token_budget > 0:
+            text = run_cpu(reduce_text, text, token_budget, size=len(text))
+
+        # Split into smaller chunks to avoid API limits
+        chunks = run_cpu(split_into_chunks, text, 2000, size=len(text))
     
     # Process each chunk separately
     partials = []
+    last_error = None
     for chunk in chunks:
+        # Stop early and keep what we have once the budget runs low
+        if not allows(deadline, "summarization"):
+            break
         try:
-            # Use the smaller model for chunk processing to reduce token usage
-            summary = generate_groq_content(chunk, chunk_prompt, api_key, model="llama3-8b-8192")
-            partials.append(summary)
-        except Exception as e:
-            # If a chunk fails, add a placeholder and continue
-            partials.append(f"[Chunk processing error: {str(e)}]")
+            # The router picks a small summary model that fits each chunk
+            partials.append(_groq_summary(chunk, chunk_prompt, api_key, deadline=deadline))
+        except SummaryError as e:
+            # Leave failed chunks out rather than feed error text to the final summary
+            last_error = e
+
+    if not partials:
+        raise last_error or SummaryError("Error: request deadline reached before any content was summarized")
+
+    partial = len(partials) < len(chunks)
     
     # Combine chunk summaries
     combined = "\n\n--- SECTION ---\n\n".join(partials)
+    if not allows(deadline, "summarization"):
+        return combined, True
     
     # If the combined summaries are still too large, summarize recursively
     if len(combined) > 4000:
@@ -291,44 +435,59 @@ def process_large_content(text: str, utype: str, api_key: str) -> str:
         final_partials = []
         
         for chunk in summary_chunks:
+            if not allows(deadline, "summarization"):
+                return combined, True
             try:
                 # Summarize each chunk of summaries
-                final_summary = generate_groq_content(
+                final_partials.append(_groq_summary(
                     chunk, 
                     "Further condense this summary section while preserving key information:", 
                     api_key, 
-                    model="llama3-8b-8192"
-                )
-                final_partials.append(final_summary)
-            except Exception as e:
-                final_partials.append(f"[Summary processing error: {str(e)}]")
+                    deadline=deadline
+                ))
+            except SummaryError:
+                # Keep the uncondensed section instead of losing it
+                final_partials.append(chunk)
         
         # Join the final summaries
         final_combined = "\n\n".join(final_partials)
+        if not allows(deadline, "summarization"):
+            return final_combined, True
         
         # Generate the final summary with a prompt that asks for conciseness
-        return generate_groq_content(
-            final_combined, 
-            final_prompts[utype] + "\n\nKeep your summary brief and within token limits:\n", 
-            api_key,
-            model="llama3-8b-8192"  # Use the smaller model for final summary to stay within limits
-        )
+        try:
+            return _groq_summary(
+                final_combined, 
+                final_prompts[utype] + "\n\nKeep your summary brief and within token limits:\n", 
+                api_key,
+                deadline=deadline
+            ), partial
+        except SummaryError:
+            return final_combined, True
     
     # If combined summaries are small enough, proceed as normal
-    return generate_groq_content(combined, final_prompts[utype], api_key, model="llama3-8b-8192")
+    try:
+        return _groq_summary(combined, final_prompts[utype], api_key, deadline=deadline), partial
+    except SummaryError:
+        # The section summaries are still a usable, if unpolished, result
+        return combined, True
 
 
-def summarize_content(url: str) -> dict:
+def summarize_content(url: str, deadline=None) -> dict:
     if not GROQ_API_KEY:
         return {"error": "GROQ_API_KEY not set"}
 
+    if not allows(deadline, "extraction"):
+        return {"error": "Request deadline too short to fetch content"}
+
     utype = get_url_type(url)
-    if utype == "youtube":
-        content, title, err = extract_transcript_details(url)
-    elif utype == "wikipedia":
-        content, title, err = extract_wikipedia_content(url)
-    else:
-        content, title, err = extract_webpage_content(url)
+    with pipeline_stage("extraction"):
+        if utype == "youtube":
+            content, title, err = extract_transcript_details(url, deadline)
+        elif utype == "wikipedia":
+            content, title, err = extract_wikipedia_content(url, deadline)
+        else:
+            content, title, err = extract_webpage_content(url, deadline)
 
     if err:
         return {"error": err}
@@ -338,7 +497,7 @@ def summarize_content(url: str) -> dict:
 
     # Always process content in chunks to avoid token limits
     try:
-        summary = process_large_content(content, utype, GROQ_API_KEY)
+        summary, partial = process_large_content(content, utype, GROQ_API_KEY, deadline=deadline)
         
         # If the summary is very short, it might indicate an error
         if len(summary) < 50 and ("error" in summary.lower() or "token" in summary.lower()):
@@ -349,11 +508,22 @@ def summarize_content(url: str) -> dict:
                 "partial_summary": "The content was processed but could not be fully summarized due to API limits."
             }
             
-        return {
+        result = {
             "type": utype,
             "title": title,
             "summary": summary
         }
+        if partial:
+            result["partial"] = True
+        return result
+    except SummaryError as e:
+        # No part of the content could be summarized, so there is nothing to analyze
+        return {
+            "type": utype,
+            "title": title,
+            "error": f"Failed to generate summary: {e}",
+            "partial_summary": "The content was fetched but could not be summarized within the request's limits."
+        }
     except Exception as e:
         return {
             "type": utype,